@@ -58,11 +58,12 @@ class LennardJones(Calculator):
 
     Implementation note:
 
-    For computational efficiency, we minimise the number of
-    pairwise evaluations, so we iterate once over all the atoms,
-    and use NeighbourList with bothways=False. In terms of the
-    equations, we therefore effectively restrict the sum over `i != j`
-    to `j > i`, and need to manually re-add the "missing" `j < i` contributions.
+    For computational efficiency, we minimise the number of pairwise
+    evaluations, so we collect the pairs of all the atoms once, using
+    NeighbourList with bothways=False, and evaluate them together as NumPy
+    arrays. In terms of the equations, we therefore effectively restrict
+    the sum over `i != j` to `j > i`, and need to manually re-add the
+    "missing" `j < i` contributions.
 
     Another consideration is the cutoff. We have to ensure that the potential
     goes to zero smoothly as an atom moves across the cutoff threshold,
@@ -105,6 +106,25 @@ class LennardJones(Calculator):
             self.parameters.rc = 3 * self.parameters.sigma
 
         self.nl = None
+        self._pairs = None
+
+    def _get_pairs(self, natoms):
+        """Flatten the neighbor list into arrays of pairs.
+
+        Returns the first and second atom of every pair (i < j, since
+        bothways=False) and the cell offset of the second atom.  The
+        arrays only change when the neighbor list is rebuilt, so they are
+        kept until the next rebuild."""
+        neighbors = []
+        offsets = []
+        for ii in range(natoms):
+            neighbors_ii, offsets_ii = self.nl.get_neighbors(ii)
+            neighbors.append(neighbors_ii)
+            offsets.append(offsets_ii)
+        first = np.repeat(np.arange(natoms), [len(n) for n in neighbors])
+        second = np.concatenate([np.zeros(0, int)] + neighbors)
+        offsets = np.concatenate([np.zeros((0, 3), int)] + offsets)
+        return first, second, offsets
 
     def calculate(
         self, atoms=None, properties=None, system_changes=all_changes,
@@ -123,7 +143,9 @@ class LennardJones(Calculator):
         if self.nl is None or 'numbers' in system_changes:
             self.nl = NeighborList([rc / 2] * natoms, self_interaction=False)
 
-        self.nl.update(self.atoms)
+        if self.nl.update(self.atoms) or self._pairs is None:
+            self._pairs = self._get_pairs(natoms)
+        first, second, offsets = self._pairs
 
         positions = self.atoms.positions
         cell = self.atoms.cell
@@ -131,41 +153,33 @@ class LennardJones(Calculator):
         # potential value at rc
         e0 = 4 * epsilon * ((sigma / rc) ** 12 - (sigma / rc) ** 6)
 
-        energies = np.zeros(natoms)
-        forces = np.zeros((natoms, 3))
-        stresses = np.zeros((natoms, 3, 3))
-
-        for ii in range(natoms):
-            neighbors, offsets = self.nl.get_neighbors(ii)
-            cells = np.dot(offsets, cell)
-
-            # pointing *towards* neighbours
-            distance_vectors = positions[neighbors] + cells - positions[ii]
-
-            r2 = (distance_vectors ** 2).sum(1)
-            c6 = (sigma ** 2 / r2) ** 3
-            c6[r2 > rc ** 2] = 0.0
-            c12 = c6 ** 2
-
-            pairwise_energies = 4 * epsilon * (c12 - c6) - e0 * (c6 != 0.0)
-            energies[ii] += 0.5 * pairwise_energies.sum()  # atomic energies
-
-            pairwise_forces = (-24 * epsilon * (2 * c12 - c6) / r2)[
-                :, np.newaxis
-            ] * distance_vectors
-
-            forces[ii] += pairwise_forces.sum(axis=0)
-            stresses[ii] += 0.5 * np.dot(
-                pairwise_forces.T, distance_vectors
-            )  # equivalent to outer product
-
-            # add j < i contributions
-            for jj, atom_j in enumerate(neighbors):
-                energies[atom_j] += 0.5 * pairwise_energies[jj]
-                forces[atom_j] += -pairwise_forces[jj]  # f_ji = - f_ij
-                stresses[atom_j] += 0.5 * np.outer(
-                    pairwise_forces[jj], distance_vectors[jj]
-                )
+        # pointing *towards* neighbours
+        distance_vectors = (positions[second] + np.dot(offsets, cell) -
+                            positions[first])
+
+        r2 = (distance_vectors ** 2).sum(1)
+        c6 = (sigma ** 2 / r2) ** 3
+        c6[r2 > rc ** 2] = 0.0
+        c12 = c6 ** 2
+
+        pairwise_energies = 4 * epsilon * (c12 - c6) - e0 * (c6 != 0.0)
+        pairwise_forces = (-24 * epsilon * (2 * c12 - c6) / r2)[
+            :, np.newaxis
+        ] * distance_vectors
+        # equivalent to outer product
+        pairwise_stresses = 0.5 * (pairwise_forces[:, :, np.newaxis] *
+                                   distance_vectors[:, np.newaxis, :])
+
+        # each pair contributes to both of its atoms, with f_ji = - f_ij
+        def pair_sum(values, sign=1):
+            return (np.bincount(first, values, natoms) +
+                    sign * np.bincount(second, values, natoms))
+
+        energies = 0.5 * pair_sum(pairwise_energies)
+        forces = np.array([pair_sum(f, -1) for f in pairwise_forces.T]).T
+        stresses = np.array([pair_sum(s) for s in
+                             pairwise_stresses.reshape(-1, 9).T]).T
+        stresses = stresses.reshape(natoms, 3, 3)
 
         # no lattice, no stress
         if self.atoms.number_of_lattice_vectors == 3:
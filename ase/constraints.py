@@ -2361,7 +2361,7 @@ class UnitCellFilter(Filter):
 
         cur_deform_grad = self.deform_grad()
         natoms = len(self.atoms)
-        pos = np.zeros((natoms + 3, 3))
+        pos = np.empty((natoms + 3, 3))  # every row is set below
         # UnitCellFilter's positions are the self.atoms.positions but without
         # the applied deformation gradient
         pos[:natoms] = np.linalg.solve(cur_deform_grad,
@@ -2424,7 +2424,6 @@ class UnitCellFilter(Filter):
         virial = -volume * (voigt_6_to_full_3x3_stress(stress) +
                             np.diag([self.scalar_pressure] * 3))
         cur_deform_grad = self.deform_grad()
-        atoms_forces = atoms_forces @ cur_deform_grad
         virial = np.linalg.solve(cur_deform_grad, virial.T).T
 
         if self.hydrostatic_strain:
@@ -2440,8 +2439,9 @@ class UnitCellFilter(Filter):
             np.fill_diagonal(virial, np.diag(virial) - vtr / 3.0)
 
         natoms = len(self.atoms)
-        forces = np.zeros((natoms + 3, 3))
-        forces[:natoms] = atoms_forces
+        forces = np.empty((natoms + 3, 3))  # every row is set below
+        # write the transformed atomic forces directly into their rows
+        np.dot(atoms_forces, cur_deform_grad, out=forces[:natoms])
         forces[natoms:] = virial / self.cell_factor
 
         self.stress = -full_3x3_to_voigt_6_stress(virial) / volume
@@ -362,11 +362,12 @@ def main(args):
                 columns.append(col.lstrip('+'))
 
     table = Table(db, verbosity=verbosity, cut=args.cut)
-    table.select(query, columns, args.sort, args.limit, args.offset)
-    if args.csv:
-        table.write_csv()
-    else:
-        table.write(query)
+    with db:  # use the same connection for selecting and counting rows
+        table.select(query, columns, args.sort, args.limit, args.offset)
+        if args.csv:
+            table.write_csv()
+        else:
+            table.write(query)
 
 
 def row2str(row) -> str:
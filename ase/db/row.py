@@ -171,7 +171,7 @@ class AtomsRow:
     def fmax(self):
         """Maximum atomic force."""
         forces = self.constrained_forces
-        return (forces**2).sum(1).max()**0.5
+        return np.sqrt(np.einsum('ij,ij->i', forces, forces).max())
 
     @property
     def constrained_forces(self):
@@ -192,7 +192,7 @@ class AtomsRow:
     @property
     def smax(self):
         """Maximum stress tensor component."""
-        return (self.stress**2).max()**0.5
+        return np.abs(self.stress).max()
 
     @property
     def mass(self):
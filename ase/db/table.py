@@ -57,6 +57,34 @@ def cutlist(lst, length):
     return lst[:9] + ['... ({} more)'.format(len(lst) - 9)]
 
 
+def column_getters(columns):
+    """Build one value-getter function per column.
+
+    The dispatch on the column name is done once here instead of once
+    for every cell of the table."""
+    t0 = now()
+
+    def age(dct):
+        return float_to_time_string(t0 - dct.ctime)
+
+    def pbc(dct):
+        return ''.join('FT'[int(p)] for p in dct.pbc)
+
+    def attribute(column):
+        # Rows without forces or stress would make the fmax and smax
+        # properties raise (and swallow) an AttributeError for every row:
+        key = {'fmax': 'forces', 'smax': 'stress'}.get(column)
+
+        def get(dct):
+            if key is not None and key not in dct:
+                return None
+            return getattr(dct, column, None)
+        return get
+
+    special = {'age': age, 'pbc': pbc}
+    return [special.get(c) or attribute(c) for c in columns]
+
+
 class Table:
     def __init__(self, connection, unique_key='id', verbosity=1, cut=35):
         self.connection = connection
@@ -74,7 +102,8 @@ class Table:
         sql_columns = get_sql_columns(columns)
         self.limit = limit
         self.offset = offset
-        self.rows = [Row(row, columns, self.unique_key)
+        getters = column_getters(columns)
+        self.rows = [Row(row, columns, self.unique_key, getters)
                      for row in self.connection.select(
                          query, verbosity=self.verbosity,
                          limit=limit, offset=offset, sort=sort,
@@ -109,60 +138,61 @@ class Table:
 
     def write(self, query=None):
         self.format()
-        L = [[len(s) for s in row.strings]
-             for row in self.rows]
-        L.append([len(c) for c in self.columns])
-        N = np.max(L, axis=0)
+        # Column widths in a single pass over the rows:
+        N = [len(c) for c in self.columns]
+        for row in self.rows:
+            N = [max(w, len(s)) for w, s in zip(N, row.strings)]
 
-        fmt = '{:{align}{width}}'
+        # Collect all lines and write them in one go instead of one
+        # print() per row:
+        lines = []
+        # One format string for a whole line, e.g. '{:>2}|{:<7}|{:>6}':
+        fmt = '|'.join('{:%s%d}' % ('<>'[a], w) for a, w in zip(self.right, N))
         if self.verbosity > 0:
-            print('|'.join(fmt.format(c, align='<>'[a], width=w)
-                           for c, a, w in zip(self.columns, self.right, N)))
+            lines.append(fmt.format(*self.columns))
         for row in self.rows:
-            print('|'.join(fmt.format(c, align='<>'[a], width=w)
-                           for c, a, w in
-                           zip(row.strings, self.right, N)))
+            lines.append(fmt.format(*row.strings))
 
-        if self.verbosity == 0:
-            return
+        if self.verbosity > 0:
+            nrows = len(self.rows)
 
-        nrows = len(self.rows)
+            if self.limit and nrows == self.limit:
+                n = self.connection.count(query)
+                lines.append('Rows: {} (showing first {})'
+                             .format(n, self.limit))
+            else:
+                lines.append('Rows: {}'.format(nrows))
 
-        if self.limit and nrows == self.limit:
-            n = self.connection.count(query)
-            print('Rows:', n, '(showing first {})'.format(self.limit))
-        else:
-            print('Rows:', nrows)
+            if self.keys:
+                lines.append('Keys: ' +
+                             ', '.join(cutlist(self.keys, self.cut)))
 
-        if self.keys:
-            print('Keys:', ', '.join(cutlist(self.keys, self.cut)))
+        if lines:
+            print('\n'.join(lines))
 
     def write_csv(self):
+        lines = []
         if self.verbosity > 0:
-            print(', '.join(self.columns))
+            lines.append(', '.join(self.columns))
         for row in self.rows:
-            print(', '.join(str(val) for val in row.values))
+            lines.append(', '.join(str(val) for val in row.values))
+        if lines:
+            print('\n'.join(lines))
 
 
 class Row:
-    def __init__(self, dct, columns, unique_key='id'):
+    def __init__(self, dct, columns, unique_key='id', getters=None):
         self.dct = dct
         self.values = None
         self.strings = None
         self.more = False
-        self.set_columns(columns)
+        self.set_columns(columns, getters)
         self.uid = dct[unique_key]
 
-    def set_columns(self, columns):
-        self.values = []
-        for c in columns:
-            if c == 'age':
-                value = float_to_time_string(now() - self.dct.ctime)
-            elif c == 'pbc':
-                value = ''.join('FT'[int(p)] for p in self.dct.pbc)
-            else:
-                value = getattr(self.dct, c, None)
-            self.values.append(value)
+    def set_columns(self, columns, getters=None):
+        if getters is None:
+            getters = column_getters(columns)
+        self.values = [get(self.dct) for get in getters]
 
     def toggle(self):
         self.more = not self.more
@@ -184,7 +214,7 @@ class Row:
                 numbers.add(column)
             elif isinstance(value, float):
                 numbers.add(column)
-                value = '{:.3f}'.format(value)
+                value = f'{value:.3f}'
             elif value is None:
                 value = ''
             self.strings.append(value)
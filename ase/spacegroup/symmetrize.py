@@ -4,12 +4,14 @@ Provides FixSymmetry class to preserve spacegroup symmetry during optimisation
 import warnings
 import numpy as np
 
-from ase.constraints import (FixConstraint, voigt_6_to_full_3x3_stress,
+from ase.constraints import (FixConstraint, UnitCellFilter,
+                             voigt_6_to_full_3x3_stress,
                              full_3x3_to_voigt_6_stress)
 from ase.utils import atoms_to_spglib_cell
 
 
-__all__ = ['refine_symmetry', 'check_symmetry', 'FixSymmetry']
+__all__ = ['refine_symmetry', 'check_symmetry', 'FixSymmetry',
+           'SymmetryReducedFilter']
 
 
 def print_symmetry(symprec, dataset):
@@ -69,14 +71,17 @@ def refine_symmetry(atoms, symprec=0.01, verbose=False):
     #    integer_vec . primitive cell vectors
     # here we are assuming that primitive vectors returned by find_primitive
     #    are compatible with std_lattice returned by get_symmetry_dataset
-    mapping_to_primitive = list(dataset['mapping_to_primitive'])
-    std_mapping_to_primitive = list(dataset['std_mapping_to_primitive'])
+    # first std cell atom for each primitive cell atom, looked up once
+    # instead of with list.index() for every atom
+    std_index = {}
+    for std_i_at, prim_i_at in enumerate(dataset['std_mapping_to_primitive']):
+        std_index.setdefault(prim_i_at, std_i_at)
+    std_i_at = np.array([std_index[prim_i_at] for prim_i_at
+                         in dataset['mapping_to_primitive']])
     pos = atoms.get_positions()
-    for i_at in range(len(atoms)):
-        std_i_at = std_mapping_to_primitive.index(mapping_to_primitive[i_at])
-        dp = aligned_std_pos[std_i_at] - pos[i_at]
-        dp_s = dp @ inv_rot_prim_cell
-        pos[i_at] = (aligned_std_pos[std_i_at] - np.round(dp_s) @ rot_prim_cell)
+    dp = aligned_std_pos[std_i_at] - pos
+    dp_s = dp @ inv_rot_prim_cell
+    pos = aligned_std_pos[std_i_at] - np.round(dp_s) @ rot_prim_cell
     atoms.set_positions(pos)
 
     # test final config with tight tol
@@ -101,11 +106,14 @@ def is_subgroup(sup_data, sub_data, tol=1e-10):
     """
     Test if spglib dataset `sub_data` is a subgroup of dataset `sup_data`
     """
+    sup_rotations = np.asarray(sup_data['rotations'])
+    sup_translations = np.asarray(sup_data['translations'])
     for rot1, trns1 in zip(sub_data['rotations'], sub_data['translations']):
-        for rot2, trns2 in zip(sup_data['rotations'], sup_data['translations']):
-            if np.all(rot1 == rot2) and np.linalg.norm(trns1 - trns2) < tol:
-                break
-        else:
+        # compare with all operations of the supergroup at once
+        same_rot = np.all(sup_rotations == rot1, axis=(1, 2))
+        dtrns = sup_translations - trns1
+        same_trns = np.einsum('ij,ij->i', dtrns, dtrns) < tol**2
+        if not np.any(same_rot & same_trns):
             return False
     return True
 
@@ -126,16 +134,23 @@ def prep_symmetry(atoms, symprec=1.0e-6, verbose=False):
     translations = dataset['translations'].copy()
     symm_map = []
     scaled_pos = atoms.get_scaled_positions()
+    natoms = len(atoms)
+    # match blocks of images against all atoms at once, with the block
+    # size chosen to bound the (block, natoms, 3) temporaries
+    chunk = max(1, 100000 // natoms)
     for (rot, trans) in zip(rotations, translations):
-        this_op_map = [-1] * len(atoms)
-        for i_at in range(len(atoms)):
-            new_p = rot @ scaled_pos[i_at, :] + trans
-            dp = scaled_pos - new_p
+        new_p = scaled_pos @ rot.T + trans
+        this_op_map = np.empty(natoms, dtype=int)
+        for start in range(0, natoms, chunk):
+            # dp[i, j] = scaled_pos[j] - new_p[start + i]
+            dp = (scaled_pos[np.newaxis, :, :] -
+                  new_p[start:start + chunk, np.newaxis, :])
             dp -= np.round(dp)
-            i_at_map = np.argmin(np.linalg.norm(dp, axis=1))
-            this_op_map[i_at] = i_at_map
+            # squared distances are enough to find the closest atom
+            this_op_map[start:start + chunk] = np.argmin(
+                np.einsum('ijk,ijk->ij', dp, dp), axis=1)
         symm_map.append(this_op_map)
-    return (rotations, translations, symm_map)
+    return (rotations, translations, np.array(symm_map))
 
 
 def symmetrize_rank1(lattice, inv_lattice, forces, rot, trans, symm_map):
@@ -145,18 +160,56 @@ def symmetrize_rank1(lattice, inv_lattice, forces, rot, trans, symm_map):
     lattice vectors expected as row vectors (same as ASE get_cell() convention),
     inv_lattice is its matrix inverse (get_reciprocal_cell().T)
     """
-    scaled_symmetrized_forces_T = np.zeros(forces.T.shape)
+    natoms = len(forces)
+    symm_map = np.asarray(symm_map).ravel()
 
     scaled_forces_T = np.dot(inv_lattice.T, forces.T)
-    for (r, t, this_op_map) in zip(rot, trans, symm_map):
-        transformed_forces_T = np.dot(r, scaled_forces_T)
-        scaled_symmetrized_forces_T[:, this_op_map] += transformed_forces_T
+    # apply all operations with a single (3 * n_ops, 3) x (3, n_atoms)
+    # product, reshaped to (n_ops, 3, n_atoms)
+    transformed_forces_T = np.dot(np.reshape(rot, (-1, 3)), scaled_forces_T)
+    transformed_forces_T.shape = (len(rot), 3, natoms)
+    # accumulate the transformed vector of each atom on its image atom
+    scaled_symmetrized_forces_T = np.array(
+        [np.bincount(symm_map, transformed_forces_T[:, i, :].ravel(),
+                     minlength=natoms) for i in range(3)])
     scaled_symmetrized_forces_T /= len(rot)
     symmetrized_forces = (lattice.T @ scaled_symmetrized_forces_T).T
 
     return symmetrized_forces
 
 
+def rank1_symmetrization_matrix(rot, symm_map):
+    """
+    Return sparse matrix that symmetrizes rank 1 tensors in scaled coordinates
+
+    For vectors `v` of shape (n_atoms, 3) in scaled coordinates, the
+    symmetrized vectors are ``(P @ v.ravel()).reshape(-1, 3)``, the same
+    result as `symmetrize_rank1()` without the conversion to and from
+    Cartesian coordinates.  `P` only depends on the symmetry operations,
+    not on the cell, so it can be built once and reused.
+    """
+    from scipy.sparse import csr_matrix
+
+    symm_map = np.asarray(symm_map)
+    nops, natoms = symm_map.shape
+    xyz = np.arange(3)
+    P = csr_matrix((3 * natoms, 3 * natoms))
+    # operation k maps component b of atom i to component a of atom
+    # symm_map[k, i] with weight rot[k, a, b] / nops; build in chunks of
+    # operations to bound the size of the temporary index arrays
+    chunk = max(1, 100000 // (9 * natoms))
+    for start in range(0, nops, chunk):
+        r = rot[start:start + chunk, np.newaxis, :, :] / nops
+        m = symm_map[start:start + chunk, :, np.newaxis, np.newaxis]
+        rows = 3 * m + xyz[:, np.newaxis]
+        cols = 3 * np.arange(natoms)[:, np.newaxis, np.newaxis] + xyz
+        r, rows, cols = np.broadcast_arrays(r, rows, cols)
+        nonzero = r != 0
+        P = P + csr_matrix((r[nonzero], (rows[nonzero], cols[nonzero])),
+                           shape=P.shape)
+    return P
+
+
 def symmetrize_rank2(lattice, lattice_inv, stress_3_3, rot):
     """
     Return symmetrized stress
@@ -166,9 +219,8 @@ def symmetrize_rank2(lattice, lattice_inv, stress_3_3, rot):
     """
     scaled_stress = np.dot(np.dot(lattice, stress_3_3), lattice.T)
 
-    symmetrized_scaled_stress = np.zeros((3, 3))
-    for r in rot:
-        symmetrized_scaled_stress += np.dot(np.dot(r.T, scaled_stress), r)
+    symmetrized_scaled_stress = np.matmul(
+        np.matmul(np.transpose(rot, (0, 2, 1)), scaled_stress), rot).sum(axis=0)
     symmetrized_scaled_stress /= len(rot)
 
     sym = np.dot(np.dot(lattice_inv, symmetrized_scaled_stress), lattice_inv.T)
@@ -188,8 +240,31 @@ class FixSymmetry(FixConstraint):
         refine_symmetry(atoms, symprec, self.verbose)  # refine initial symmetry
         sym = prep_symmetry(atoms, symprec, self.verbose)
         self.rotations, self.translations, self.symm_map = sym
+        # spglib gives integer rotations; keep a float copy so that the
+        # symmetrization does not have to convert them on every call
+        self.rotations = self.rotations.astype(float)
         self.do_adjust_positions = adjust_positions
         self.do_adjust_cell = adjust_cell
+        self._cell_cache = (None, None, None)
+        self._rank1_projector = rank1_symmetrization_matrix(self.rotations,
+                                                            self.symm_map)
+
+    def _get_cell_and_inverse(self, atoms):
+        """Return the cell and its inverse, reusing the inverse as long as
+        the cell does not change."""
+        cell = atoms.get_cell()
+        key = cell.array.tobytes()
+        if key != self._cell_cache[0]:
+            self._cell_cache = (key, cell, np.linalg.inv(cell))
+        return self._cell_cache[1], self._cell_cache[2]
+
+    def _symmetrize_rank1(self, atoms, vectors):
+        """Symmetrize (n_atoms, 3) Cartesian vectors using the precomputed
+        projector, see `rank1_symmetrization_matrix()`."""
+        cell, cell_inv = self._get_cell_and_inverse(atoms)
+        scaled_vectors = np.dot(vectors, cell_inv)
+        scaled_symmetrized = self._rank1_projector @ scaled_vectors.ravel()
+        return np.dot(scaled_symmetrized.reshape(-1, 3), cell)
 
     def adjust_cell(self, atoms, cell):
         if not self.do_adjust_cell:
@@ -198,8 +273,7 @@ class FixSymmetry(FixConstraint):
         # UnitCellFilter uses deformation gradient as cell DOF with steps
         # dF = stress.F^-T quantity that should be symmetrized is therefore dF .
         # F^T assume prev F = I, so just symmetrize dF
-        cur_cell = atoms.get_cell()
-        cur_cell_inv = atoms.get_reciprocal_cell().T
+        cur_cell, cur_cell_inv = self._get_cell_and_inverse(atoms)
 
         # F defined such that cell = cur_cell . F^T
         # assume prev F = I, so dF = F - I
@@ -229,25 +303,19 @@ class FixSymmetry(FixConstraint):
             return
         # symmetrize changes in position as rank 1 tensors
         step = new - atoms.positions
-        symmetrized_step = symmetrize_rank1(atoms.get_cell(),
-                                            atoms.get_reciprocal_cell().T, step,
-                                            self.rotations, self.translations,
-                                            self.symm_map)
+        symmetrized_step = self._symmetrize_rank1(atoms, step)
         new[:] = atoms.positions + symmetrized_step
 
     def adjust_forces(self, atoms, forces):
         # symmetrize forces as rank 1 tensors
         # print('adjusting forces')
-        forces[:] = symmetrize_rank1(atoms.get_cell(),
-                                     atoms.get_reciprocal_cell().T, forces,
-                                     self.rotations, self.translations,
-                                     self.symm_map)
+        forces[:] = self._symmetrize_rank1(atoms, forces)
 
     def adjust_stress(self, atoms, stress):
         # symmetrize stress as rank 2 tensor
         raw_stress = voigt_6_to_full_3x3_stress(stress)
-        symmetrized_stress = symmetrize_rank2(atoms.get_cell(),
-                                              atoms.get_reciprocal_cell().T,
+        cell, cell_inv = self._get_cell_and_inverse(atoms)
+        symmetrized_stress = symmetrize_rank2(cell, cell_inv,
                                               raw_stress, self.rotations)
         stress[:] = full_3x3_to_voigt_6_stress(symmetrized_stress)
 
@@ -260,11 +328,176 @@ class FixSymmetry(FixConstraint):
 
         ind_reversed = np.zeros((len(ind)), dtype=int)
         ind_reversed[ind] = range(len(ind))
-        new_symm_map = []
-        for sm in self.symm_map:
-            new_sm = np.array([-1] * len(atoms))
-            for at_i in range(len(ind)):
-                new_sm[ind_reversed[at_i]] = ind_reversed[sm[at_i]]
-            new_symm_map.append(new_sm)
+        symm_map = np.asarray(self.symm_map)
+        new_symm_map = np.empty_like(symm_map)
+        new_symm_map[:, ind_reversed] = ind_reversed[symm_map]
 
         self.symm_map = new_symm_map
+        self._rank1_projector = rank1_symmetrization_matrix(self.rotations,
+                                                            self.symm_map)
+
+
+class SymmetryReducedFilter(UnitCellFilter):
+    """
+    Relax positions and cell in the symmetry-invariant subspace only.
+
+    The atoms are symmetrized with `refine_symmetry()` and the degrees of
+    freedom of a `UnitCellFilter` (atomic positions and deformation
+    gradient) are replaced by symmetry-adapted coordinates, e.g. a single
+    lattice constant for a cubic crystal with atoms on fixed Wyckoff
+    sites, instead of 3 * (natoms + 3) coordinates.
+
+    Each row of the reduced positions holds the free coordinates of one
+    orbit of symmetry-equivalent atoms, scaled so that a unit change
+    moves every atom of the orbit by unit length, and the remaining rows
+    hold the free components of the deformation gradient.  The optimizer
+    `maxstep` therefore limits the atomic displacements as it does for
+    `UnitCellFilter`.  The forces are the derivatives of the energy with
+    respect to these coordinates, i.e. the force on an orbit row is the
+    sum of the forces on its atoms, so `fmax` is applied more strictly
+    to orbits with several atoms.
+
+    The `UnitCellFilter` options `mask`, `hydrostatic_strain` and
+    `constant_volume` restrict the cell to those symmetric deformations
+    that they allow.
+
+    The coordinates are built from the sparse symmetrization matrix.  For
+    supercells the symmetry operations include the lattice translations,
+    so their number, and the size of that matrix, grow as natoms**2.
+
+    Requires spglib and scipy.
+    """
+
+    def __init__(self, atoms, symprec=0.01, verbose=False, **kwargs):
+        """
+        Parameters
+        ----------
+        atoms - Atoms object to relax, symmetrized in place
+        symprec - symmetry precision passed to spglib
+        verbose - if True, print out symmetry information
+        kwargs - passed on to `UnitCellFilter`
+        """
+        refine_symmetry(atoms, symprec, verbose)
+        rot, trans, symm_map = prep_symmetry(atoms, symprec, verbose)
+        UnitCellFilter.__init__(self, atoms, **kwargs)
+
+        self.basis, self.slots, self.nrows = _symmetry_adapted_basis(
+            atoms.get_cell(), rot, symm_map, _virial_projector(self))
+        # the columns of the basis are orthogonal, but not normalised
+        self.norm2 = np.asarray(
+            self.basis.multiply(self.basis).sum(axis=0)).ravel()
+        self.reference = UnitCellFilter.get_positions(self).ravel()
+
+    def _reduced_array(self, coordinates):
+        reduced = np.zeros(3 * self.nrows)
+        reduced[self.slots] = coordinates
+        return reduced.reshape(-1, 3)
+
+    def get_positions(self):
+        full = UnitCellFilter.get_positions(self).ravel()
+        return self._reduced_array(
+            self.basis.T @ (full - self.reference) / self.norm2)
+
+    def set_positions(self, new, **kwargs):
+        full = self.reference + self.basis @ np.ravel(new)[self.slots]
+        UnitCellFilter.set_positions(self, full.reshape(-1, 3), **kwargs)
+
+    def get_forces(self, **kwargs):
+        full = UnitCellFilter.get_forces(self, **kwargs).ravel()
+        return self._reduced_array(self.basis.T @ full)
+
+    def __len__(self):
+        return self.nrows
+
+
+def _symmetry_adapted_basis(cell, rot, symm_map, virial_projector):
+    """
+    Return sparse basis of the symmetry-invariant `UnitCellFilter` subspace
+
+    Returns a tuple `(basis, slots, nrows)`: the columns of `basis` are
+    the coordinate vectors, `slots` gives the position of each coordinate
+    in the raveled (nrows, 3) reduced positions.  The cell coordinates
+    are restricted to the range of the 9x9 `virial_projector`.
+    """
+    from scipy.sparse import block_diag, csc_matrix, hstack, identity, kron
+
+    natoms = symm_map.shape[1]
+    cell_inv = np.linalg.inv(cell)
+    # the symmetrization matrix in Cartesian coordinates is an orthogonal
+    # projector, as the symmetry operations are orthogonal there
+    projector = csc_matrix(kron(identity(natoms), cell.T) @
+                           rank1_symmetrization_matrix(rot, symm_map) @
+                           kron(identity(natoms), cell_inv.T))
+
+    columns = []
+    slots = []
+    nrows = 0
+    done = np.zeros(natoms, dtype=bool)
+    for i in range(natoms):
+        if done[i]:
+            continue
+        orbit = np.unique(symm_map[:, i])
+        done[orbit] = True
+        # the projector maps displacements of atom i onto the orbit,
+        # with the site symmetry projector of atom i divided by the orbit
+        # size as its diagonal block
+        block = projector[:, 3 * i:3 * i + 3] * len(orbit)
+        site = _orthonormal_basis(block[3 * i:3 * i + 3].toarray())
+        if site.shape[1] == 0:
+            continue
+        # every atom of the orbit is moved by a rotated copy of the
+        # orthonormal site displacements, so all columns have unit rows
+        columns.append(block @ csc_matrix(site))
+        slots.extend(3 * nrows + np.arange(site.shape[1]))
+        nrows += 1
+
+    natoms_basis = (hstack(columns) if columns else
+                    csc_matrix((3 * natoms, 0)))
+
+    # deformation gradient: symmetric deformations that the cell options
+    # of the filter allow, i.e. the eigenvectors with eigenvalue 1 of the
+    # symmetrizer restricted to the range of the virial projector
+    u, s, _ = np.linalg.svd(virial_projector)
+    allowed = u[:, s > 1e-8]
+    symmetric = _cartesian_rank2_projector(cell, cell_inv, rot)
+    values, vectors = np.linalg.eigh(allowed.T @ symmetric @ allowed)
+    cell_basis = allowed @ vectors[:, values > 0.5]
+    # one common scale keeps the cell step along the projected virial;
+    # no row of the deformation gradient changes by more than unit length
+    # for a unit change of a coordinate
+    if cell_basis.shape[1]:
+        cell_basis /= np.linalg.norm(cell_basis.reshape(3, 3, -1),
+                                     axis=1).max()
+    slots.extend(3 * nrows + np.arange(cell_basis.shape[1]))
+    nrows += -(-cell_basis.shape[1] // 3)
+
+    basis = block_diag((natoms_basis, csc_matrix(cell_basis)), format='csr')
+    basis.eliminate_zeros()
+    return basis, np.array(slots, dtype=int), nrows
+
+
+def _virial_projector(ucf):
+    """Dense 9x9 matrix of the cell options applied to the virial."""
+    columns = []
+    for virial in np.eye(9).reshape(9, 3, 3):
+        # same steps as in UnitCellFilter.get_forces()
+        if ucf.hydrostatic_strain:
+            virial = np.eye(3) * virial.trace() / 3.0
+        virial = virial * ucf.mask
+        if ucf.constant_volume:
+            virial = virial - np.eye(3) * virial.trace() / 3.0
+        columns.append(virial.ravel())
+    return np.array(columns).T
+
+
+def _cartesian_rank2_projector(cell, cell_inv, rot):
+    """Dense 9x9 matrix applying `symmetrize_rank2()` to raveled tensors."""
+    return np.array([symmetrize_rank2(cell, cell_inv, unit.reshape(3, 3),
+                                      rot).ravel()
+                     for unit in np.eye(9)]).T
+
+
+def _orthonormal_basis(projector):
+    """Orthonormal basis (as columns) of the range of a small projector."""
+    u, s, _ = np.linalg.svd(projector)
+    return u[:, s > 0.5]
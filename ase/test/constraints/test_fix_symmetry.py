@@ -5,7 +5,12 @@ from ase.atoms import Atoms
 from ase.build import bulk
 from ase.calculators.calculator import all_changes
 from ase.calculators.lj import LennardJones
-from ase.spacegroup.symmetrize import FixSymmetry, check_symmetry, is_subgroup
+from ase.spacegroup.symmetrize import (FixSymmetry, check_symmetry,
+                                       is_subgroup, prep_symmetry,
+                                       symmetrize_rank1,
+                                       rank1_symmetrization_matrix,
+                                       SymmetryReducedFilter)
+from ase.optimize import BFGS
 from ase.optimize.precon.lbfgs import PreconLBFGS
 from ase.constraints import UnitCellFilter, ExpCellFilter
 
@@ -141,3 +146,76 @@ def test_fix_symmetry_shuffle_indices():
     permut_dp2 = perturb(at_permut, pos0, 1, (0.0, 0.1, -0.1))
     assert np.max(np.abs(dp1 - permut_dp1)) < 1.0e-10
     assert np.max(np.abs(dp2 - permut_dp2)) < 1.0e-10
+
+
+def test_rank1_symmetrization_matrix():
+    at_init, at_rot = setup_cell()
+    atoms = at_rot * (2, 1, 1)
+    rotations, translations, symm_map = prep_symmetry(atoms)
+    P = rank1_symmetrization_matrix(rotations, symm_map)
+
+    cell = atoms.get_cell()
+    cell_inv = np.linalg.inv(cell)
+    forces = np.random.RandomState(2).normal(size=(len(atoms), 3))
+    ref = symmetrize_rank1(cell, cell_inv, forces,
+                           rotations, translations, symm_map)
+    sym = (P @ (forces @ cell_inv).ravel()).reshape(-1, 3) @ cell
+    assert np.allclose(sym, ref, atol=1e-12)
+
+
+def relax_reduced_and_full(atoms, cell_options={}, **lj):
+    at_reduced = atoms.copy()
+    at_reduced.calc = LennardJones(**lj)
+    reduced = SymmetryReducedFilter(at_reduced, **cell_options)
+    BFGS(reduced).run(fmax=1e-5, steps=300)
+
+    at_full = atoms.copy()
+    at_full.calc = LennardJones(**lj)
+    at_full.set_constraint(FixSymmetry(at_full))
+    BFGS(UnitCellFilter(at_full, **cell_options)).run(fmax=1e-5, steps=300)
+
+    assert at_reduced.get_potential_energy() == pytest.approx(
+        at_full.get_potential_energy(), abs=1e-8)
+    assert np.allclose(at_reduced.cell, at_full.cell, atol=1e-5)
+    assert np.allclose(at_reduced.positions, at_full.positions, atol=1e-5)
+    return reduced
+
+
+def test_symmetry_reduced_filter():
+    at_init, at_rot = setup_cell()
+    at = at_rot * (2, 2, 2)
+    at.positions[0, 0] += 1.0e-7
+    # cubic cell with atoms on fixed sites: only the lattice constant is free
+    reduced = relax_reduced_and_full(at)
+    assert reduced.basis.shape[1] == 1
+    assert len(reduced) == 1
+    assert check_symmetry(at, 1.0e-6)['number'] == 229
+
+
+def test_symmetry_reduced_filter_free_parameters():
+    # hcp on fixed sites: a and c
+    reduced = relax_reduced_and_full(bulk('Mg', 'hcp', a=1.1, c=1.6))
+    assert reduced.basis.shape[1] == 2
+    # wurtzite: a, c, u and a translation along the polar axis
+    reduced = relax_reduced_and_full(
+        bulk('ZnO', 'wurtzite', a=3.2, c=5.1, u=0.4), sigma=2.0, rc=6.0)
+    assert reduced.basis.shape[1] == 4
+    # one row for each of the Zn and O orbits and one for the cell
+    assert len(reduced) == 3
+
+
+@pytest.mark.parametrize('cell_options', [dict(hydrostatic_strain=True),
+                                          dict(constant_volume=True),
+                                          dict(mask=[1, 1, 0, 0, 0, 0])])
+def test_symmetry_reduced_filter_cell_options(cell_options):
+    relax_reduced_and_full(bulk('ZnO', 'wurtzite', a=3.2, c=5.1, u=0.4),
+                           cell_options, sigma=2.0, rc=6.0)
+
+
+def test_symmetry_reduced_filter_mask():
+    # a cubic cell can not be strained along x only without breaking the
+    # symmetry, so the cell is fixed
+    atoms = bulk('Al', 'fcc', a=2.0, cubic=True)
+    atoms.calc = LennardJones()
+    reduced = SymmetryReducedFilter(atoms, mask=[1, 0, 0, 0, 0, 0])
+    assert reduced.basis.shape[1] == 0
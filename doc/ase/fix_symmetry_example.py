@@ -3,7 +3,7 @@ import numpy as np
 from ase.build import bulk
 from ase.calculators.lj import LennardJones
 from ase.spacegroup.symmetrize import FixSymmetry, check_symmetry
-from ase.optimize import BFGS
+from ase.optimize import LBFGS
 from ase.constraints import UnitCellFilter
 
 # We setup a bcc Al cell - bcc is unstable with LJ potential
@@ -19,7 +19,7 @@ atoms_unsym = atoms_init.copy()
 atoms_unsym.calc = LennardJones()
 ucf_unsym = UnitCellFilter(atoms_unsym)
 
-dyn = BFGS(ucf_unsym)
+dyn = LBFGS(ucf_unsym)
 print("Initial Energy", atoms_unsym.get_potential_energy())
 dyn.run(fmax=0.001)
 print("Final Energy", atoms_unsym.get_potential_energy())
@@ -30,7 +30,7 @@ atoms_sym.calc = LennardJones()
 atoms_sym.set_constraint(FixSymmetry(atoms_sym))
 ucf_sym = UnitCellFilter(atoms_sym)
 
-dyn = BFGS(ucf_sym)
+dyn = LBFGS(ucf_sym)
 print("Initial Energy", atoms_sym.get_potential_energy())
 dyn.run(fmax=0.001)
 print("Final Energy", atoms_sym.get_potential_energy())